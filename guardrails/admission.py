@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, Optional
+from event_loop import get_background_loop
+
+
+class Priority(IntEnum):
+    """Lower values are admitted first"""
+
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class AdmissionError(Exception):
+    """Base class for turns the admission layer refused to run to completion"""
+
+
+class AdmissionRejected(AdmissionError):
+    """Queue full, shed for higher-priority work, or the user is over their limit"""
+
+
+class DeadlineExceeded(AdmissionError):
+    """The turn's deadline passed while it was queued or running"""
+
+
+class AdmissionController:
+    """
+    Admission layer in front of chat turns: a bounded priority queue feeding a fixed
+    number of concurrent slots, per-user limits, deadlines and fast rejection.
+
+    Like the LLM scheduler, all state lives on the shared background event loop and
+    calls from other loops are forwarded to it.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        per_user_limit: int = 2,
+        default_timeout: Optional[float] = 60.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self.default_timeout = default_timeout
+        self.loop = get_background_loop()
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self._in_flight = 0
+        self._per_user: Dict[str, int] = {}
+        self._waits = deque(maxlen=1000)
+        self._counters = {"admitted": 0, "rejected": 0, "shed": 0, "expired": 0}
+
+    def _shed_lowest(self, priority: Priority) -> bool:
+        """Reject the lowest-priority queued turn if it ranks below `priority`"""
+        waiting = [entry for entry in self._heap if not entry[2].done()]
+        if not waiting:
+            return False
+        worst = max(waiting, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= priority:
+            return False
+        worst[2].set_exception(AdmissionRejected("Shed to make room for higher-priority work"))
+        self._queued -= 1
+        self._counters["shed"] += 1
+        return True
+
+    async def _acquire(self, priority: Priority, deadline: Optional[float]):
+        if self._in_flight < self.max_concurrency and self._queued == 0:
+            self._in_flight += 1
+            return
+
+        if self._queued >= self.max_queue and not self._shed_lowest(priority):
+            raise AdmissionRejected("Server is busy, please try again shortly")
+
+        waiter = self.loop.loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+        self._queued += 1
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not waiter.done():
+                waiter.cancel()
+                self._queued -= 1
+            elif not waiter.cancelled() and waiter.exception() is None:
+                # Granted a slot just as the deadline hit; hand it on
+                self._release_slot()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._counters["expired"] += 1
+            raise DeadlineExceeded("Request expired while waiting in the queue")
+
+    def _release_slot(self):
+        """Free a slot, handing it straight to the best waiting turn if there is one"""
+        while self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            if not waiter.done():
+                self._queued -= 1
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    async def _run(
+        self,
+        turn: Callable[[], Awaitable],
+        user_id: str,
+        priority: Priority,
+        timeout: Optional[float]
+    ):
+        if self._per_user.get(user_id, 0) >= self.per_user_limit:
+            self._counters["rejected"] += 1
+            raise AdmissionRejected("Too many requests in progress for this user")
+
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        enqueued = time.monotonic()
+
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        try:
+            try:
+                await self._acquire(priority, deadline)
+            except AdmissionRejected:
+                self._counters["rejected"] += 1
+                raise
+
+            self._waits.append(time.monotonic() - enqueued)
+            self._counters["admitted"] += 1
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                return await asyncio.wait_for(turn(), remaining)
+            except asyncio.TimeoutError:
+                self._counters["expired"] += 1
+                raise DeadlineExceeded("Request exceeded its deadline and was cancelled")
+            finally:
+                self._release_slot()
+        finally:
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+
+    async def run(
+        self,
+        turn: Callable[[], Awaitable],
+        user_id: str,
+        priority: Priority = Priority.INTERACTIVE,
+        timeout: Optional[float] = None
+    ):
+        """
+        Run turn() once admitted. turn is a factory so rejected work is never started.
+        Raises AdmissionRejected or DeadlineExceeded instead of running late or overloaded.
+        """
+        coro = self._run(turn, user_id, priority, timeout)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop.loop:
+            return await coro
+        return await asyncio.wrap_future(self.loop.submit(coro))
+
+    def metrics(self) -> Dict:
+        """Queue depth, in-flight turns, counters and recent queue wait percentiles ("shed" is a subset of "rejected")"""
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000 if waits else 0.0
+
+        return {
+            "queue_depth": self._queued,
+            "in_flight": self._in_flight,
+            **self._counters,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+        }
+
+
+_controller = None
+_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller, configured from ADMISSION_* environment variables"""
+    global _controller
+    with _lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "4")),
+                max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+                per_user_limit=int(os.getenv("ADMISSION_PER_USER_LIMIT", "2")),
+                default_timeout=float(os.getenv("ADMISSION_TIMEOUT_SECONDS", "60")) or None
+            )
+        return _controller
@@ -1,8 +1,9 @@
 import streamlit as st
-from chatbot import RAGChatbot
+from chatbot import RAGChatbot, DEFAULT_TENANT
 import os
-import asyncio
-from functools import wraps
+from event_loop import get_background_loop
+from admission import AdmissionError
+import uuid
 import time
 import re
 
@@ -14,33 +15,46 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Helper function to run async functions in Streamlit
-def async_to_sync(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return asyncio.run(func(*args, **kwargs))
-    return wrapper
+# Helper function to run coroutines from Streamlit on the shared background loop.
+# Only the coroutine runs on the loop thread; Streamlit calls stay in the script thread.
+def run_async(coro):
+    return get_background_loop().run(coro)
 
 CHROMA_DB_PATH = "chroma_db"  # Directory to store the ChromaDB files
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR")  # Serve exported snapshots read-only when set
+# The workspace is fixed by the deployment, not chosen in the UI: this app has no
+# authentication, so a user-editable workspace would expose every tenant's documents
+APP_TENANT = os.getenv("APP_TENANT", DEFAULT_TENANT)
 
 def initialize_session_state():
     """Initialize session state variables"""
     try:
-        if "messages" not in st.session_state:
-            st.session_state.messages = []
         if "chatbot" not in st.session_state:
             with st.spinner("Initializing chatbot..."):
                 if not os.path.exists(CHROMA_DB_PATH):
                     os.makedirs(CHROMA_DB_PATH)
-                st.session_state.chatbot = RAGChatbot(persist_directory=CHROMA_DB_PATH)
+                st.session_state.chatbot = RAGChatbot(
+                    persist_directory=CHROMA_DB_PATH,
+                    tenant=APP_TENANT,
+                    snapshot_directory=INDEX_SNAPSHOT_DIR
+                )
+        if "conversation" not in st.session_state:
+            st.session_state.conversation = st.session_state.chatbot.new_conversation()
+        # Bounded view of the conversation used for rendering
+        st.session_state.messages = st.session_state.conversation.messages
         if "processing" not in st.session_state:
             st.session_state.processing = False
+        if "user_id" not in st.session_state:
+            st.session_state.user_id = uuid.uuid4().hex
+        # Pick up newly exported snapshot versions on replicas (no-op otherwise)
+        st.session_state.chatbot.reload_snapshots()
     except Exception as e:
         st.error(f"Error initializing chatbot: {str(e)}")
         raise
 
 def display_chat_history():
     """Display chat history with improved styling"""
+    # messages is capped by ConversationState, so render cost does not grow with the session
     for idx, message in enumerate(st.session_state.messages):
         # Add message container with custom styling
         with st.chat_message(
@@ -79,6 +93,10 @@ def display_chat_history():
 
 def handle_file_upload():
     """Handle PDF file upload with improved UI"""
+    if st.session_state.chatbot.snapshots is not None:
+        st.info("🔒 Read-only replica: documents are served from an index snapshot")
+        return
+    
     with st.container():
         uploaded_files = st.file_uploader(
             "📄 Upload PDF Documents",
@@ -100,23 +118,16 @@ def handle_file_upload():
                 
                 with st.spinner("📚 Processing documents..."):
                     try:
-                        # Create docs directory if it doesn't exist
-                        if not os.path.exists("docs"):
-                            os.makedirs("docs")
-                        
-                        # Save uploaded files
-                        for uploaded_file in uploaded_files:
-                            file_path = os.path.join("docs", uploaded_file.name)
-                            with open(file_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-                        
-                        # Process and add documents
-                        documents = st.session_state.chatbot.process_pdf_to_documents()
-                        if documents:
-                            st.session_state.chatbot.add_documents(documents)
-                            st.success(f"✅ Successfully processed {len(documents)} document chunks!")
-                        else:
-                            st.warning("⚠️ No documents were processed. Please check the uploaded files.")
+                        # Parse only the uploaded files, straight from memory
+                        report = st.session_state.chatbot.ingest_pdf_bytes(
+                            [(uploaded_file.name, uploaded_file.getbuffer()) for uploaded_file in uploaded_files]
+                        )
+                        if report["added"]:
+                            st.success(f"✅ Successfully processed {report['added']} document chunks!")
+                        for name, reason in report["skipped"].items():
+                            st.warning(f"⚠️ Skipped {name}: {reason}")
+                        for name, error in report["failed"].items():
+                            st.error(f"❌ Could not read {name}: {error}")
                     
                     except Exception as e:
                         st.error(f"❌ Error processing documents: {str(e)}")
@@ -136,45 +147,41 @@ def format_response(response: str) -> str:
     
     return response
 
-@async_to_sync
-async def process_user_input(user_input: str):
+def process_user_input(user_input: str):
     """Process user input and generate response"""
     if user_input:
         try:
-            # Add user message to chat history
-            st.session_state.messages.append({"role": "user", "content": user_input})
+            conversation = st.session_state.conversation
             
             with st.chat_message("assistant"):
                 with st.spinner("🤔 Thinking..."):
                     try:
-                        # Register actions for each conversation
-                        st.session_state.chatbot.app.register_action(
-                            action=st.session_state.chatbot.retrieve_context,
-                            name="retrieve_context",
-                        )
-                        
-                        st.session_state.chatbot.app.register_action(
-                            action=st.session_state.chatbot.chat,
-                            name="chat",
-                        )
-                        
-                        # Generate and format response
-                        response = await st.session_state.chatbot.app.generate_async(prompt=user_input)
-                        formatted_response = format_response(response)
+                        # Generate and format response with the bounded conversation history
+                        response = run_async(st.session_state.chatbot.generate(
+                            conversation.build_messages(user_input),
+                            user_id=st.session_state.user_id
+                        ))
+                        formatted_response = format_response(response["content"])
                         
 
                         info = st.session_state.chatbot.app.explain()
                         info.print_llm_calls_summary()
-                        # Add assistant response to chat history
-                        st.session_state.messages.append(
-                            {"role": "assistant", "content": formatted_response}
-                        )
+                        # Add the turn to the conversation (queues turns leaving the window)
+                        conversation.add("user", user_input)
+                        conversation.add("assistant", formatted_response)
                         st.markdown(formatted_response)
+                        # Fold queued turns into the summary in the background, after rendering
+                        conversation.fold_pending()
+                        
+                    except AdmissionError as e:
+                        # Overloaded or timed out: tell the user without recording a failed turn
+                        st.warning(f"⏳ {str(e)}")
                         
                     except Exception as e:
                         error_message = f"❌ Error: {str(e)}"
                         st.error(error_message)
-                        st.session_state.messages.append(
+                        conversation.messages.append({"role": "user", "content": user_input})
+                        conversation.messages.append(
                             {"role": "assistant", "content": error_message}
                         )
         except Exception as e:
@@ -336,6 +343,8 @@ def main():
         
         # Sidebar with improved layout
         with st.sidebar:
+            st.caption(f"🗂️ Workspace: {st.session_state.chatbot.tenant}")
+            
             st.markdown("### 📚 Document Management")
             handle_file_upload()
             
@@ -345,10 +354,14 @@ def main():
             col1, col2, col3 = st.columns(3)
             with col1:
                 if st.button("Clear Chat", use_container_width=True):
-                    st.session_state.messages = []
+                    st.session_state.conversation.clear()
                     st.rerun()
             with col2:
-                if st.button("Clear DB", use_container_width=True):
+                if st.button(
+                    "Clear DB",
+                    use_container_width=True,
+                    disabled=st.session_state.chatbot.snapshots is not None
+                ):
                     try:
                         # Get all document IDs
                         doc_count = st.session_state.chatbot.collection.count()
@@ -370,10 +383,17 @@ def main():
                     st.rerun()
             
             # Display document count
-            doc_count = st.session_state.chatbot.collection.count()
+            doc_count = st.session_state.chatbot.document_count()
             if doc_count > 0:
                 st.success(f"📚 {doc_count} document chunks in database")
             
+            # Admission queue metrics
+            metrics = st.session_state.chatbot.admission.metrics()
+            st.caption(
+                f"⚙️ Queue: {metrics['queue_depth']} waiting · {metrics['in_flight']} running · "
+                f"p95 wait {metrics['wait_p95_ms']:.0f} ms · {metrics['rejected']} rejected"
+            )
+            
             st.markdown("---")
             st.markdown("""
             ### 📖 How to use:
@@ -384,12 +404,12 @@ def main():
             
             ### 🛠️ Controls:
             - **Clear Chat**: Removes chat history
-            - **Clear DB**: Removes all documents
+            - **Clear DB**: Removes all documents in the workspace
             - **New Session**: Restarts the application
             """)
         
         # Main chat interface
-        doc_count = st.session_state.chatbot.collection.count()
+        doc_count = st.session_state.chatbot.document_count()
         if doc_count == 0:
             st.info("👋 Welcome! Please upload and process some documents to start chatting.")
         else:
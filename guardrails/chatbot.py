@@ -1,100 +1,263 @@
+import hashlib
+import io
 import os
-from typing import List, Dict
+import re
+from typing import List, Dict, Optional, Tuple, Union
 import chromadb
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-from nemoguardrails import LLMRails, RailsConfig
-import nest_asyncio
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import CharacterTextSplitter
+from nemoguardrails import LLMRails
+from nemoguardrails.library.self_check.input_check.actions import self_check_input
+from nemoguardrails.library.self_check.output_check.actions import self_check_output
+from pypdf import PdfReader
+from chunker import TokenChunker
+from embedding import EmbeddingEngine
+from conversation import ConversationState
+from rails_config import load_rails_config, load_rag_settings
+from retrieval import RetrievalResult, RetrievedChunk
+from snapshot import export_snapshot, get_snapshot_store
+from verdict_cache import cached_self_check, get_verdict_cache
+from llm_scheduler import ScheduledChatModel, get_scheduler
+from admission import Priority, get_admission_controller
 import asyncio
 import torch
 
 torch.classes.__path__ = []
-# Apply nest_asyncio to handle async operations
-nest_asyncio.apply()
+
+DEFAULT_TENANT = "default"
+COLLECTION_PREFIX = "RAG_guardrails"
 
 # Load environment variables
 load_dotenv()
 
 # Configure OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not client.api_key:
+if not os.getenv("OPENAI_API_KEY"):
     raise ValueError("OPENAI_API_KEY not found in environment variables")
 
+def collection_name(tenant: str) -> str:
+    """
+    Map a tenant to its own Chroma collection so searches only scan that tenant's chunks.
+    The readable slug is lossy, so a hash of the exact tenant name keeps distinct tenants
+    apart; the name always starts and ends with an alphanumeric as Chroma requires.
+    Tenants partition data but are not an access control: callers must derive the
+    tenant from an authenticated identity, never from free user input.
+    """
+    if tenant == DEFAULT_TENANT:
+        return COLLECTION_PREFIX
+    if not tenant:
+        raise ValueError("Tenant name must not be empty")
+    slug = re.sub(r"[^a-zA-Z0-9_-]", "_", tenant)[:30].strip("_-")
+    digest = hashlib.sha256(tenant.encode()).hexdigest()[:10]
+    return f"{COLLECTION_PREFIX}__{slug}_{digest}" if slug else f"{COLLECTION_PREFIX}__{digest}"
+
 class RAGChatbot:
-    def __init__(self, pdf_directory="docs", persist_directory="chroma_db"):
-        # Initialize ChromaDB with persistence
-        try:
-            self.chroma_client = chromadb.PersistentClient(path=persist_directory)
-            self.collection = self.chroma_client.get_or_create_collection(
-                name="RAG_guardrails",
-                metadata={"hnsw:space": "cosine"}
-            )
-        except Exception as e:
-            raise
+    def __init__(
+        self,
+        pdf_directory="docs",
+        persist_directory="chroma_db",
+        tenant=DEFAULT_TENANT,
+        snapshot_directory=None
+    ):
+        self.tenant = tenant
+        self.collections = {}
+        # Initialize ChromaDB with persistence; read-only replicas never open it,
+        # so they don't create or write persist_directory
+        self.chroma_client = None
+        if not snapshot_directory:
+            try:
+                self.chroma_client = chromadb.PersistentClient(path=persist_directory)
+                self.get_collection(tenant)
+            except Exception as e:
+                raise
         
         self.pdf_directory = pdf_directory
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
-        self.config = RailsConfig.from_path("config")
-        self.app = LLMRails(config=self.config, verbose=True)
+        self.embedder = EmbeddingEngine(
+            'all-MiniLM-L6-v2',
+            backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+            device=os.getenv("EMBEDDING_DEVICE") or None,
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+            num_threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None
+        )
+        self.chunker = TokenChunker.from_embedder(self.embedder)
+        # With a snapshot directory the chatbot is a read-only replica serving exported indexes
+        self.snapshots = (
+            get_snapshot_store(snapshot_directory, self.embedder.model_name)
+            if snapshot_directory else None
+        )
+        self.config = load_rails_config("config")
+        retrieval_settings = load_rag_settings("config").get("retrieval", {})
+        self.top_k = retrieval_settings.get("top_k", 3)
+        self.similarity_threshold = retrieval_settings.get("similarity_threshold", 0.5)
+        # Every LLM call, including the self-check rails, goes through the shared scheduler
+        self.llm_scheduler = get_scheduler()
+        self.admission = get_admission_controller()
+        self.app = LLMRails(
+            config=self.config,
+            llm=ScheduledChatModel(model_name=self.config.models[0].model),
+            verbose=True
+        )
         
         # Share the collection with actions.py
         global collection, embedder
-        collection = self.collection
+        collection = self.collection if self.chroma_client is not None else None
         embedder = self.embedder
         
+        # Actions are bound once here; they must not be re-registered per message
+        self.app.register_action(self.retrieve_context, name="retrieve_context")
+        self.app.register_action(self.chat, name="chat")
+        
+        # Reuse self-check verdicts for text that was already judged under the same prompt
+        self.verdict_cache = get_verdict_cache()
+        self.app.register_action(
+            cached_self_check(self.verdict_cache, "self_check_input", self_check_input, ["user_message"]),
+            name="self_check_input"
+        )
         self.app.register_action(
-            "retrieve_context",
-            lambda query: self.retrieve_context(query)
+            cached_self_check(
+                self.verdict_cache, "self_check_output", self_check_output, ["user_message", "bot_message"]
+            ),
+            name="self_check_output"
         )
-        self.openai_client = client
+
+    def get_collection(self, tenant: Optional[str] = None):
+        """Return (creating on first use) the collection holding a tenant's documents"""
+        if self.chroma_client is None:
+            raise RuntimeError("Snapshot replicas have no ChromaDB collections")
+        tenant = tenant or self.tenant
+        if tenant not in self.collections:
+            self.collections[tenant] = self.chroma_client.get_or_create_collection(
+                name=collection_name(tenant),
+                metadata={"hnsw:space": "cosine", "tenant": tenant}
+            )
+        return self.collections[tenant]
+
+    @property
+    def collection(self):
+        """Collection of the chatbot's active tenant"""
+        return self.get_collection()
+
+    def ingest_status(self, file_hash: str, tenant: Optional[str] = None, source: Optional[str] = None) -> Optional[str]:
+        """
+        Why a file would be skipped as already ingested, or None if it is new:
+        "duplicate" when its content hash is stored, "legacy" when it can only be
+        matched by name because every stored chunk with that source predates file_hash
+        """
+        if self.snapshots is not None:
+            return None
+        collection = self.get_collection(tenant)
+        if collection.get(where={"file_hash": file_hash}, limit=1, include=[])["ids"]:
+            return "duplicate"
+        if source is None:
+            return None
+        metadatas = collection.get(where={"source": source}, include=["metadatas"])["metadatas"] or []
+        if metadatas and not any("file_hash" in (metadata or {}) for metadata in metadatas):
+            return "legacy"
+        return None
+
+    def is_ingested(self, file_hash: str, tenant: Optional[str] = None, source: Optional[str] = None) -> bool:
+        """Whether a file with this content hash (or a legacy chunk with its name) is already stored"""
+        return self.ingest_status(file_hash, tenant, source) is not None
+
+    def _chunk_pdf(self, name: str, data: Union[bytes, memoryview], file_hash: str) -> List[Dict]:
+        reader = PdfReader(io.BytesIO(data))
+        pages = [(number, page.extract_text() or "") for number, page in enumerate(reader.pages, start=1)]
+        chunks = self.chunker.split_pages(pages, metadata={"source": name, "file_hash": file_hash})
+
+        # Content-addressed ids stay unique across uploads and sessions
+        return [
+            {
+                "id": f"{file_hash[:16]}_{chunk['metadata']['chunk']}",
+                "text": chunk["text"],
+                "metadata": chunk["metadata"]
+            }
+            for chunk in chunks
+        ]
+
+    def process_pdf_bytes(
+        self,
+        name: str,
+        data: Union[bytes, memoryview],
+        tenant: Optional[str] = None,
+        seen: Optional[set] = None
+    ) -> List[Dict]:
+        """
+        Parse and chunk one PDF from an in-memory buffer, e.g. an upload's getbuffer()
+        Returns no chunks if the same file content was already ingested for the tenant,
+        or is in seen (the hashes of files already processed in the current batch)
+        """
+        file_hash = hashlib.sha256(data).hexdigest()
+        if seen is not None:
+            if file_hash in seen:
+                return []
+            seen.add(file_hash)
+        if self.is_ingested(file_hash, tenant, source=name):
+            return []
+        return self._chunk_pdf(name, data, file_hash)
+
+    def ingest_pdf_bytes(self, files: List[Tuple[str, Union[bytes, memoryview]]], tenant: Optional[str] = None) -> Dict:
+        """
+        Chunk, embed and store only the given in-memory PDFs. A file that cannot be read
+        is reported and skipped without affecting the rest of the batch.
+        Returns {"added": chunk count, "skipped": {name: reason}, "failed": {name: error}}
+        """
+        documents, seen = [], set()
+        skipped, failed = {}, {}
+        for name, data in files:
+            file_hash = hashlib.sha256(data).hexdigest()
+            # Identical files in one batch would produce duplicate chunk ids
+            if file_hash in seen:
+                skipped[name] = "same content as another file in this upload"
+                continue
+            seen.add(file_hash)
+
+            status = self.ingest_status(file_hash, tenant, source=name)
+            if status == "duplicate":
+                skipped[name] = "already in the database"
+                continue
+            if status == "legacy":
+                skipped[name] = "a file with this name was stored before content hashes were recorded; clear the database to re-index it"
+                continue
+
+            try:
+                chunks = self._chunk_pdf(name, data, file_hash)
+            except Exception as e:
+                failed[name] = str(e)
+                continue
+            if not chunks:
+                skipped[name] = "no extractable text"
+            documents.extend(chunks)
+
+        self.add_documents(documents, tenant)
+        return {"added": len(documents), "skipped": skipped, "failed": failed}
 
     def process_pdf_to_documents(self):
-        """Process PDFs into document chunks"""
+        """Process not-yet-ingested PDFs in pdf_directory into document chunks"""
         if not os.path.exists(self.pdf_directory):
             os.makedirs(self.pdf_directory)
             return []
 
-        documents = []
-        doc_id = 0
+        documents, seen = [], set()
         pdf_files = [f for f in os.listdir(self.pdf_directory) if f.endswith('.pdf')]
 
         for file in pdf_files:
             try:
-                pdf_path = os.path.join(self.pdf_directory, file)
-                loader = PyPDFLoader(pdf_path)
-                pdf_documents = loader.load()
-                
-                text_splitter = CharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=20,
-                    separator="\n"
-                )
-                chunks = text_splitter.split_documents(pdf_documents)
-                
-                for chunk in chunks:
-                    documents.append({
-                        "id": f"doc_{doc_id}",
-                        "text": chunk.page_content,
-                        "metadata": {"source": file}
-                    })
-                    doc_id += 1
+                with open(os.path.join(self.pdf_directory, file), "rb") as f:
+                    documents.extend(self.process_pdf_bytes(file, f.read(), seen=seen))
                     
             except Exception as e:
                 continue
 
         return documents
 
-    def add_documents(self, documents: List[Dict[str, str]]):
-        """Add documents to ChromaDB"""
+    def add_documents(self, documents: List[Dict[str, str]], tenant: Optional[str] = None):
+        """Add documents to the tenant's ChromaDB collection (the active tenant by default)"""
+        if self.snapshots is not None:
+            raise RuntimeError("Cannot add documents to a read-only snapshot replica")
         if not documents:
             return
             
         try:
             embeddings = self.embedder.encode([doc['text'] for doc in documents]).tolist()
-            self.collection.add(
+            self.get_collection(tenant).add(
                 ids=[doc['id'] for doc in documents],
                 embeddings=embeddings,
                 documents=[doc['text'] for doc in documents],
@@ -104,41 +267,100 @@ class RAGChatbot:
         except Exception as e:
             raise
 
-    def retrieve_context(self, query: str, k: int = 3) -> str:
-        """Retrieve relevant context from ChromaDB"""
+    def retrieve(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        tenant: Optional[str] = None,
+        where: Optional[Dict] = None
+    ) -> RetrievalResult:
+        """
+        Retrieve scored chunks from the tenant's ChromaDB collection
+        where: optional Chroma metadata filter, e.g. {"source": "Company Profile.pdf"}
+        """
+        result = RetrievalResult(query=query, threshold=self.similarity_threshold)
         try:
-            query_embedding = self.embedder.encode(query).tolist()
-            collection_size = self.collection.count()
+            if self.snapshots is not None:
+                index = self.snapshots.get(collection_name(tenant or self.tenant))
+                if index is not None and query.strip():
+                    result.chunks = index.query(self.embedder.encode(query), k or self.top_k, where)
+                return result
             
-            if collection_size == 0:
-                return ""
+            collection = self.get_collection(tenant)
+            collection_size = collection.count()
             
-            k = min(k, collection_size)
-            results = self.collection.query(
+            if collection_size == 0 or not query.strip():
+                return result
+            
+            query_embedding = self.embedder.encode(query).tolist()
+            k = min(k or self.top_k, collection_size)
+            results = collection.query(
                 query_embeddings=[query_embedding],
                 n_results=k,
-                include=["documents", "metadatas"]
+                where=where,
+                include=["documents", "metadatas", "distances"]
             )
             
             if not results['documents'] or not results['documents'][0]:
-                return ""
+                return result
             
-            context_parts = []
-            for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
-                source = metadata.get('source', 'Unknown source')
-                context_parts.append(f"From {source}:\n{doc}")
+            for doc, metadata, distance in zip(
+                results['documents'][0], results['metadatas'][0], results['distances'][0]
+            ):
+                result.chunks.append(RetrievedChunk(text=doc, metadata=metadata or {}, score=1 - distance))
             
-            return "\n\n---\n\n".join(context_parts)
+            return result
             
         except Exception as e:
-            return ""
+            print(f"Error in retrieve: {str(e)}")
+            return result
+
+    async def retrieve_context(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        tenant: Optional[str] = None,
+        where: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Rails action: retrieval verdict and context, so flows can skip generation when nothing is relevant.
+        Embedding and search run in a worker thread so they don't block the shared event loop.
+        """
+        result = await asyncio.to_thread(self.retrieve, query, k=k, tenant=tenant, where=where)
+        return result.to_dict()
 
-    def chat(self, query: str, context: str) -> str:
-        """Chat with the bot"""
+    def document_count(self, tenant: Optional[str] = None) -> int:
+        """Number of chunks searchable for the tenant, from the snapshot on replicas"""
+        if self.snapshots is not None:
+            index = self.snapshots.get(collection_name(tenant or self.tenant))
+            return index.count() if index is not None else 0
+        return self.get_collection(tenant).count()
+
+    def export_snapshot(self, directory: str, tenant: Optional[str] = None) -> str:
+        """Export the tenant's collection as a new snapshot version under directory"""
+        name = collection_name(tenant or self.tenant)
+        return export_snapshot(
+            self.get_collection(tenant),
+            os.path.join(directory, name),
+            self.embedder.model_name
+        )
+
+    def reload_snapshots(self) -> List[str]:
+        """Switch replicas to newly exported snapshot versions; returns the collections that changed"""
+        return self.snapshots.reload() if self.snapshots is not None else []
+
+    async def chat(self, query: str, retrieved_context: str, history: str = "") -> str:
+        """
+        Chat with the bot
+        The context parameter name is reserved: the rails runtime overwrites any action
+        argument called `context` with the whole flow context, hence retrieved_context
+        """
         try:
-            prompt = f"User query: {query}\n\nContext:\n{context}\n\nAnswer based only on the context above."
+            prompt = f"User query: {query}\n\nContext:\n{retrieved_context}\n\nAnswer based only on the context above."
+            if history:
+                prompt = f"Conversation so far:\n{history}\n\n{prompt}"
 
-            response = client.chat.completions.create(
+            content = await self.llm_scheduler.complete(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant that answers questions based only on the provided context. If the answer cannot be found in the context, say that you don't have enough information."},
@@ -146,7 +368,6 @@ class RAGChatbot:
                 ]
             )
             
-            content = response.choices[0].message.content
             if not content:
                 return "I apologize, but I encountered an error."
 
@@ -154,6 +375,42 @@ class RAGChatbot:
         except Exception as e:
             return f"I apologize, but I encountered an error. Please try again. chat error: {str(e)}"
 
+    async def generate(
+        self,
+        messages: List[Dict],
+        user_id: str,
+        priority: Priority = Priority.INTERACTIVE,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """
+        Run one guarded turn through admission control
+        Raises AdmissionRejected when overloaded and DeadlineExceeded when the turn runs out of time
+        """
+        return await self.admission.run(
+            lambda: self.app.generate_async(messages=messages),
+            user_id=user_id,
+            priority=priority,
+            timeout=timeout
+        )
+
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Fold messages that left the conversation window into the running summary"""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        content = await self.llm_scheduler.complete(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You maintain a concise running summary of a conversation. Keep facts, names and open questions the user may refer back to. Reply with the updated summary only."},
+                {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"}
+            ],
+            temperature=0,
+            max_tokens=300
+        )
+        return content or summary
+
+    def new_conversation(self) -> ConversationState:
+        """Create bounded conversation memory that summarizes with this chatbot's LLM"""
+        return ConversationState(summarizer=self.summarize)
+
 
 async def main():
     try:
@@ -166,6 +423,8 @@ async def main():
         else:
             print("No documents to process. Please add PDFs to the 'docs' directory.")
         
+        conversation = chatbot.new_conversation()
+        
         # Chat loop
         print("\nBot: Hello! I'm ready to help you with questions. (type 'quit' to exit)")
         while True:
@@ -174,22 +433,18 @@ async def main():
                 break
                 
             try:
-                chatbot.app.register_action(
-                    action=chatbot.retrieve_context,
-                    name="retrieve_context",
+                response = await chatbot.generate(
+                    conversation.build_messages(user_input),
+                    user_id="cli"
                 )
-                               
-                chatbot.app.register_action(
-                    action=chatbot.chat,
-                    name="chat",
-                )
-
-                
-                response = await chatbot.app.generate_async(prompt=user_input)
                 info = chatbot.app.explain()
                 info.print_llm_calls_summary()
                 
-                print(f"Bot: {response}")
+                conversation.add("user", user_input)
+                conversation.add("assistant", response["content"])
+                print(f"Bot: {response['content']}")
+                # Summarize older turns in the background while the user types
+                conversation.fold_pending()
                 # print(info)
 
             except Exception as e:
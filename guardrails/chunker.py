@@ -0,0 +1,143 @@
+import re
+from bisect import bisect_right
+from typing import List, Dict, Tuple, Optional
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = (".", "!", "?", ";", ":")
+
+
+class TokenChunker:
+    """Split page text into chunks measured in embedder tokens"""
+
+    def __init__(self, tokenizer, chunk_size: int = 256, chunk_overlap: int = 32):
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("TokenChunker requires a fast (Rust-backed) tokenizer")
+
+        self.tokenizer = tokenizer
+        # Leave room for the special tokens the embedder adds ([CLS] / [SEP])
+        self.chunk_size = chunk_size - tokenizer.num_special_tokens_to_add()
+        self.chunk_overlap = chunk_overlap
+        if self.chunk_size <= 0:
+            raise ValueError("chunk_size must leave room for the tokenizer's special tokens")
+        if chunk_overlap >= self.chunk_size:
+            raise ValueError(
+                f"chunk_overlap must be smaller than the usable chunk size ({self.chunk_size} tokens)"
+            )
+
+    @classmethod
+    def from_embedder(cls, embedder, chunk_overlap: int = 32):
+        """Build a chunker sized to a SentenceTransformer's max sequence length"""
+        return cls(
+            embedder.tokenizer,
+            chunk_size=embedder.max_seq_length,
+            chunk_overlap=chunk_overlap
+        )
+
+    def _paragraphs(self, text: str) -> List[str]:
+        paragraphs = [p.strip() for p in PARAGRAPH_BREAK.split(text)]
+        return [p for p in paragraphs if p]
+
+    @staticmethod
+    def _last_break(breaks: List[int], start: int, limit: int) -> Optional[int]:
+        """Largest break position b with start < b <= limit"""
+        idx = bisect_right(breaks, limit) - 1
+        return breaks[idx] if idx >= 0 and breaks[idx] > start else None
+
+    def _split_oversized(self, text: str, offsets: List[Tuple[int, int]], word_ids: List[int]) -> List[Tuple[str, int]]:
+        """
+        Split a paragraph that exceeds the chunk size, preferring line and sentence
+        boundaries, then word boundaries; a single word longer than a chunk is cut hard
+        """
+        n = len(offsets)
+        # Word starts: a new word id preceded by whitespace, so cuts never land inside a
+        # wordpiece sequence or between a word and its trailing punctuation
+        word_starts = [
+            i for i in range(n)
+            if i == 0 or (word_ids[i] != word_ids[i - 1] and offsets[i][0] > offsets[i - 1][1])
+        ]
+        # Token i starts a new line or sentence when the gap before it holds a newline,
+        # or when the previous token ends a sentence and is followed by whitespace
+        structural = [
+            i for i in word_starts[1:]
+            if "\n" in text[offsets[i - 1][1]:offsets[i][0]]
+            or (
+                text[offsets[i - 1][0]:offsets[i - 1][1]].endswith(SENTENCE_END)
+                and offsets[i][0] > offsets[i - 1][1]
+            )
+        ]
+
+        windows = []
+        start = 0
+        while start < n:
+            limit = start + self.chunk_size
+            if limit >= n:
+                end, clean_cut = n, True
+            else:
+                end = self._last_break(structural, start, limit)
+                clean_cut = end is not None
+                if end is None:
+                    end = self._last_break(word_starts, start, limit) or limit
+            windows.append((text[offsets[start][0]:offsets[end - 1][1]].strip(), end - start))
+            if end == n:
+                break
+
+            if clean_cut:
+                start = end
+            else:
+                # Mid-sentence cut: overlap the next chunk, starting it on a word boundary
+                idx = bisect_right(word_starts, max(end - self.chunk_overlap, start + 1) - 1)
+                start = min(word_starts[idx], end) if idx < len(word_starts) else end
+        return windows
+
+    def split_pages(self, pages: List[Tuple[int, str]], metadata: Optional[Dict] = None) -> List[Dict]:
+        """
+        Split pages into token-bounded chunks
+        pages: List of (page_number, text); chunks never span two pages or split a
+        paragraph unless that paragraph alone exceeds the chunk size, in which case it
+        is split on line, sentence and then word boundaries
+        """
+        metadata = metadata or {}
+
+        units = []
+        for page, text in pages:
+            units.extend((page, paragraph) for paragraph in self._paragraphs(text))
+        if not units:
+            return []
+
+        # Tokenize every paragraph of the document in a single batched call
+        encoded = self.tokenizer(
+            [paragraph for _, paragraph in units],
+            add_special_tokens=False,
+            return_offsets_mapping=True
+        )
+
+        chunks = []
+        current, current_tokens, current_page = [], 0, None
+
+        def flush():
+            if current:
+                chunks.append((current_page, "\n\n".join(current), current_tokens))
+
+        for idx, ((page, paragraph), offsets) in enumerate(zip(units, encoded["offset_mapping"])):
+            n_tokens = len(offsets)
+
+            if page != current_page or current_tokens + n_tokens > self.chunk_size:
+                flush()
+                current, current_tokens, current_page = [], 0, page
+
+            if n_tokens > self.chunk_size:
+                for window, window_tokens in self._split_oversized(paragraph, offsets, encoded.word_ids(idx)):
+                    chunks.append((page, window, window_tokens))
+                continue
+
+            current.append(paragraph)
+            current_tokens += n_tokens
+        flush()
+
+        return [
+            {
+                "text": text,
+                "metadata": {**metadata, "page": page, "chunk": idx, "tokens": n_tokens}
+            }
+            for idx, (page, text, n_tokens) in enumerate(chunks)
+        ]
@@ -2,17 +2,12 @@ from typing import Optional
 from nemoguardrails.actions import action
 import chromadb
 from sentence_transformers import SentenceTransformer
-import os
-from openai import OpenAI
+from llm_scheduler import get_scheduler
 # Global variables for vector store components
 chroma_client = None
 collection = None
 embedder = None
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not client.api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
 def init_vector_store():
     """Initialize vector store components"""
     global chroma_client, collection, embedder
@@ -50,7 +45,7 @@ async def retrieve_context(query: str) -> str:
 
         # Generate a response using OpenAI
         try:
-            completion = client.chat.completions.create(
+            content = await get_scheduler().complete(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant that answers questions based only on the provided context. If the answer cannot be found in the context, say that you don't have enough information."},
@@ -60,8 +55,8 @@ async def retrieve_context(query: str) -> str:
                 max_tokens=150
             )
             
-            if completion.choices and completion.choices[0].message.content:
-                return completion.choices[0].message.content
+            if content:
+                return content
         except Exception as e:
             print(f"Error generating OpenAI response: {str(e)}")
 
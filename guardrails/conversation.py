@@ -0,0 +1,169 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional
+from event_loop import get_background_loop
+from llm_scheduler import CHARS_PER_TOKEN, count_tokens, load_encoding
+
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+
+class ConversationState:
+    """
+    Bounded conversation memory: a window of recent messages kept verbatim, a rolling
+    summary of everything older, and a capped list of messages kept for display.
+
+    Messages leaving the window are queued and folded into the summary in batches by
+    fold_pending(), which runs the summarizer on the background event loop so it never
+    delays a response. Until a batch is folded its messages stay in the history verbatim,
+    and the history is cut to token_budget whenever it is built.
+    """
+
+    def __init__(
+        self,
+        summarizer: Optional[Summarizer] = None,
+        window_messages: int = 6,
+        token_budget: int = 1500,
+        summary_token_budget: int = 300,
+        fold_messages: int = 4,
+        fold_tokens: int = 400,
+        max_stored_messages: int = 50,
+        model: str = "gpt-4o-mini"
+    ):
+        self.summarizer = summarizer
+        self.window_messages = window_messages
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.fold_messages = fold_messages
+        self.fold_tokens = fold_tokens
+        self.encoding = load_encoding(model)
+
+        self.messages = deque(maxlen=max_stored_messages)
+        self.window = deque()
+        self.pending = deque()
+        self.summary = ""
+        self._lock = threading.Lock()
+        self._folding: Optional[Future] = None
+        self._generation = 0
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(self.encoding, text)
+
+    def _tokens(self, messages) -> int:
+        return sum(self.count_tokens(message["content"]) for message in messages)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the most recent max_tokens tokens of text"""
+        if self.encoding is None:
+            return text[-max_tokens * CHARS_PER_TOKEN:] if max_tokens > 0 else ""
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[-max_tokens:])
+
+    async def _fold(self, summary: str, batch: List[Dict[str, str]], generation: int):
+        """Merge a batch of evicted messages into the running summary"""
+        transcript = "".join(f"\n{m['role']}: {m['content']}" for m in batch)
+        if self.summarizer:
+            try:
+                summary = await self.summarizer(summary, batch)
+            except Exception as e:
+                print(f"Error summarizing conversation: {str(e)}")
+                summary += transcript
+        else:
+            summary += transcript
+        summary = self._truncate(summary.strip(), self.summary_token_budget)
+
+        with self._lock:
+            # Dropped if the conversation was cleared while the summarizer ran
+            if generation == self._generation:
+                self.summary = summary
+                for _ in batch:
+                    self.pending.popleft()
+
+    def add(self, role: str, content: str):
+        """Record a message, queueing the oldest window messages for summarization when over budget"""
+        message = {"role": role, "content": content}
+        with self._lock:
+            self.messages.append(message)
+            self.window.append(message)
+
+            # Leave room for the summary and for a batch of messages waiting to be folded
+            window_budget = self.token_budget - self.summary_token_budget - self.fold_tokens
+            while len(self.window) > 1 and (
+                len(self.window) > self.window_messages or self._tokens(self.window) > window_budget
+            ):
+                self.pending.append(self.window.popleft())
+
+    def fold_pending(self, force: bool = False) -> Optional[Future]:
+        """
+        Start folding queued messages into the summary once fold_messages of them or
+        fold_tokens worth have piled up (or whenever any are queued, with force).
+        Call it after a turn has been shown; returns the background future, or None
+        if there was nothing to fold or a fold is already running.
+        """
+        with self._lock:
+            if not self.pending or (self._folding is not None and not self._folding.done()):
+                return None
+            if not force and len(self.pending) < self.fold_messages and self._tokens(self.pending) < self.fold_tokens:
+                return None
+            batch = list(self.pending)
+            self._folding = get_background_loop().submit(self._fold(self.summary, batch, self._generation))
+            return self._folding
+
+    def _budgeted(self):
+        """
+        Summary and recent messages (queued plus window) cut to token_budget, dropping
+        the oldest messages first and truncating one that alone exceeds what is left.
+        Returns (summary, recent, window_count): the last window_count recent entries
+        come from the window.
+        """
+        with self._lock:
+            summary = self._truncate(self.summary, self.summary_token_budget)
+            recent = [*self.pending, *self.window]
+            window_size = len(self.window)
+
+        remaining = self.token_budget - self.count_tokens(summary)
+        kept = []
+        for message in reversed(recent):
+            tokens = self.count_tokens(f"{message['role']}: {message['content']}")
+            if tokens > remaining:
+                if remaining > 0 and not kept:
+                    kept.append({**message, "content": self._truncate(message["content"], remaining)})
+                break
+            kept.append(message)
+            remaining -= tokens
+        kept.reverse()
+        return summary, kept, min(window_size, len(kept))
+
+    def _history_text(self, summary: str, recent: List[Dict[str, str]]) -> str:
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation:\n{summary}")
+        if recent:
+            parts.append("Recent messages:\n" + "\n".join(
+                f"{m['role']}: {m['content']}" for m in recent
+            ))
+        return "\n\n".join(parts)
+
+    def history_text(self) -> str:
+        """Summary plus recent turns as plain text within token_budget, for prompts that take history as a string"""
+        summary, recent, _ = self._budgeted()
+        return self._history_text(summary, recent)
+
+    def build_messages(self, user_input: str) -> List[Dict]:
+        """Messages for LLMRails.generate_async: history context, recent window, then the new input"""
+        summary, recent, window_count = self._budgeted()
+        return [
+            {"role": "context", "content": {"conversation_history": self._history_text(summary, recent)}},
+            *recent[len(recent) - window_count:],
+            {"role": "user", "content": user_input}
+        ]
+
+    def clear(self):
+        with self._lock:
+            self.messages.clear()
+            self.window.clear()
+            self.pending.clear()
+            self.summary = ""
+            self._generation += 1
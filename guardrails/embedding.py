@@ -0,0 +1,125 @@
+from typing import List, Optional, Union
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+BACKENDS = ("torch", "onnx", "onnx-quantized", "fastembed")
+
+# Pre-exported fp32 and int8 weights shipped in the sentence-transformers model repos
+ONNX_FILE = "onnx/model.onnx"
+QUANTIZED_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# Sequence length the MiniLM sentence-transformers models are trained with
+# (their tokenizers advertise 512)
+NON_TORCH_MAX_SEQ_LENGTH = 256
+
+
+class EmbeddingEngine:
+    """Length-bucketed, batched wrapper around the sentence embedding model"""
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        backend: str = "torch",
+        device: Optional[str] = None,
+        batch_size: int = 64,
+        num_threads: Optional[int] = None,
+        normalize: bool = True
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.normalize = normalize
+
+        if backend == "fastembed":
+            from fastembed import TextEmbedding
+            from transformers import AutoTokenizer
+
+            repo_id = f"sentence-transformers/{model_name}"
+            self.model = TextEmbedding(model_name=repo_id, threads=num_threads)
+            self.tokenizer = AutoTokenizer.from_pretrained(repo_id)
+            self.max_seq_length = min(self.tokenizer.model_max_length, NON_TORCH_MAX_SEQ_LENGTH)
+        elif backend in ("onnx", "onnx-quantized"):
+            # Run the exported graph with onnxruntime directly; SentenceTransformer's onnx
+            # backend would additionally require optimum
+            import onnxruntime
+            from huggingface_hub import hf_hub_download
+            from transformers import AutoTokenizer
+
+            repo_id = f"sentence-transformers/{model_name}"
+            session_options = onnxruntime.SessionOptions()
+            if num_threads:
+                session_options.intra_op_num_threads = num_threads
+            model_path = hf_hub_download(
+                repo_id, QUANTIZED_ONNX_FILE if backend == "onnx-quantized" else ONNX_FILE
+            )
+            self.model = onnxruntime.InferenceSession(
+                model_path, session_options, providers=["CPUExecutionProvider"]
+            )
+            self.input_names = {i.name for i in self.model.get_inputs()}
+            self.tokenizer = AutoTokenizer.from_pretrained(repo_id)
+            self.max_seq_length = min(self.tokenizer.model_max_length, NON_TORCH_MAX_SEQ_LENGTH)
+        else:
+            self.model = SentenceTransformer(model_name, device=device)
+            self.tokenizer = self.model.tokenizer
+            self.max_seq_length = self.model.max_seq_length
+
+    def _encode_onnx(self, texts: List[str]) -> np.ndarray:
+        """Forward pass plus the model's mean pooling over non-padding tokens"""
+        inputs = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        token_embeddings = self.model.run(None, feed)[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        if self.backend == "fastembed":
+            return np.stack(list(self.model.embed(texts, batch_size=len(texts))))
+        if self.backend != "torch":
+            return self._encode_onnx(texts)
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        Embed one text or a list of texts
+        Returns a float32 array of shape (dim,) for a single text, (n, dim) otherwise
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Sort by length so each batch pads to a similar size, then restore order
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        batches = [
+            self._encode_batch(sorted_texts[start:start + self.batch_size])
+            for start in range(0, len(sorted_texts), self.batch_size)
+        ]
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+
+        if self.normalize:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+
+        return embeddings[0] if single else embeddings
@@ -0,0 +1,56 @@
+import asyncio
+import atexit
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+
+class BackgroundEventLoop:
+    """
+    A long-lived asyncio loop running in a daemon thread. Coroutines submitted from
+    synchronous code (e.g. Streamlit reruns) share the loop, so async clients,
+    connection pools and pending tasks survive between calls.
+    """
+
+    def __init__(self, name: str = "guardrails-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the loop and return a concurrent Future for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block the calling thread until it completes"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("BackgroundEventLoop.run() cannot be called from the loop thread")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+
+_background_loop = None
+_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """Return the process-wide background loop, starting it on first use"""
+    global _background_loop
+    with _lock:
+        if _background_loop is None:
+            _background_loop = BackgroundEventLoop()
+            atexit.register(_background_loop.stop)
+        return _background_loop
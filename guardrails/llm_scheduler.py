@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import openai
+import tiktoken
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from openai import AsyncOpenAI
+from event_loop import get_background_loop
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_COMPLETION_TOKENS = 256
+
+MESSAGE_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+# Rough tokens-per-character ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+def load_encoding(model: str = DEFAULT_MODEL):
+    """
+    tiktoken encoding for model, or None if it cannot be loaded. The first load downloads
+    the BPE file, so resolve it once up front, never per request on the event loop.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # e.g. offline on first use, when the BPE file cannot be downloaded
+        print(f"Could not load tiktoken encoding, estimating tokens from length: {str(e)}")
+        return None
+
+
+def count_tokens(encoding, text: str) -> int:
+    """Token count with encoding, or a length-based estimate when encoding is None"""
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `rate` units per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        """Wait until `amount` units are available, then take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """Take units without waiting; the bucket may go into debt"""
+        self._refill()
+        self.tokens -= amount
+
+
+class LLMScheduler:
+    """
+    Single gateway for chat completion calls: caps concurrency, enforces request and
+    token budgets, retries transient failures with jittered backoff and coalesces
+    identical in-flight requests into one upstream call.
+
+    All scheduling state lives on the shared background event loop; calls made from
+    any other loop or thread are forwarded to it.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        max_concurrency: int = 8,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200_000,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0
+    ):
+        # Retries are handled here so they count against the shared budgets
+        self.client = client or AsyncOpenAI(max_retries=0)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.loop = get_background_loop()
+        # Resolved here, off the event loop; only used to estimate budgets
+        self.encoding = load_encoding(DEFAULT_MODEL)
+
+        self.request_bucket = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute / 60))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 6)
+        self._semaphore = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def _request_key(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        payload = json.dumps([model, messages, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _estimate_tokens(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> int:
+        prompt_tokens = sum(count_tokens(self.encoding, m.get("content") or "") + 4 for m in messages)
+        return prompt_tokens + (params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when the API sends one"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def _call(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        estimate = self._estimate_tokens(model, messages, params)
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimate)
+            try:
+                async with self._semaphore:
+                    response = await self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        **params
+                    )
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"LLM call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            usage = {}
+            if response.usage:
+                usage = {
+                    "prompt_tokens": response.usage.prompt_tokens,
+                    "completion_tokens": response.usage.completion_tokens,
+                    "total_tokens": response.usage.total_tokens,
+                }
+                if response.usage.total_tokens > estimate:
+                    self.token_bucket.consume(response.usage.total_tokens - estimate)
+            return response.choices[0].message.content or "", usage
+
+    async def _complete(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        key = self._request_key(model, messages, params)
+        if key in self._in_flight:
+            # Coalesced callers share the answer but spent no tokens of their own
+            content, _ = await asyncio.shield(self._in_flight[key])
+            return content, {}
+
+        future = asyncio.ensure_future(self._call(model, messages, params))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def complete(self, messages: List[Dict[str, str]], model: str = DEFAULT_MODEL, **params) -> str:
+        """Run a chat completion through the scheduler and return the message content"""
+        content, _ = await self.complete_with_usage(messages, model=model, **params)
+        return content
+
+    async def complete_with_usage(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        **params
+    ) -> Tuple[str, Dict[str, int]]:
+        """Like complete(), also returning the API's token usage (empty if none was reported)"""
+        coro = self._complete(model, messages, params)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop.loop:
+            return await coro
+        return await asyncio.wrap_future(self.loop.submit(coro))
+
+    def complete_sync(self, messages: List[Dict[str, str]], model: str = DEFAULT_MODEL, **params) -> str:
+        """Blocking variant of complete() for synchronous callers"""
+        content, _ = self.complete_sync_with_usage(messages, model=model, **params)
+        return content
+
+    def complete_sync_with_usage(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        **params
+    ) -> Tuple[str, Dict[str, int]]:
+        """Blocking variant of complete_with_usage() for synchronous callers"""
+        return self.loop.run(self._complete(model, messages, params))
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler, configured from LLM_* environment variables"""
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+                requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")),
+                tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000")),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "5"))
+            )
+        return _scheduler
+
+
+class ScheduledChatModel(BaseChatModel):
+    """LangChain chat model that sends LLMRails' own calls (self-check rails etc.) through the scheduler"""
+
+    model_name: str = DEFAULT_MODEL
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "scheduled-openai"
+
+    def _request(self, messages: List[BaseMessage], stop: Optional[List[str]]):
+        openai_messages = [
+            {"role": MESSAGE_ROLES.get(m.type, "user"), "content": m.content}
+            for m in messages
+        ]
+        params = {"temperature": self.temperature}
+        if self.max_tokens:
+            params["max_tokens"] = self.max_tokens
+        if stop:
+            params["stop"] = stop
+        return openai_messages, params
+
+    def _result(self, content: str, usage: Dict[str, int]) -> ChatResult:
+        # token_usage is what LLMRails reads to report per-call token counts in explain()
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={"token_usage": usage, "model_name": self.model_name}
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        openai_messages, params = self._request(messages, stop)
+        return self._result(*get_scheduler().complete_sync_with_usage(openai_messages, model=self.model_name, **params))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        openai_messages, params = self._request(messages, stop)
+        return self._result(*await get_scheduler().complete_with_usage(openai_messages, model=self.model_name, **params))
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+import yaml
+from nemoguardrails import RailsConfig
+
+CONFIG_SUFFIXES = (".yml", ".yaml", ".co")
+SNAPSHOT_VERSION = 1
+
+# Compiled configs already loaded in this process, keyed by (config path, fingerprint)
+_compiled: Dict[tuple, RailsConfig] = {}
+_lock = threading.Lock()
+
+
+def config_fingerprint(config_path: str) -> str:
+    """Content hash of every YAML and Colang file that RailsConfig.from_path reads"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(config_path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(CONFIG_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, config_path).encode())
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _snapshot_path(config_path: str, cache_dir: str) -> str:
+    name = os.path.basename(os.path.abspath(config_path))
+    return os.path.join(cache_dir, f"{name}.rails.json")
+
+
+def _read_snapshot(snapshot_path: str, fingerprint: str) -> Optional[RailsConfig]:
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("fingerprint") != fingerprint:
+            return None
+        return RailsConfig.model_validate(snapshot["config"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable rails snapshot {snapshot_path}: {str(e)}")
+        return None
+
+
+def _write_snapshot(snapshot_path: str, fingerprint: str, config: RailsConfig):
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "fingerprint": fingerprint,
+                "config": config.model_dump(mode="json")
+            }, f)
+        os.replace(tmp_path, snapshot_path)
+    except Exception as e:
+        print(f"Could not write rails snapshot {snapshot_path}: {str(e)}")
+
+
+def load_rails_config(config_path: str = "config", cache_dir: Optional[str] = ".rails_cache") -> RailsConfig:
+    """
+    Load a RailsConfig, parsing YAML, prompts and Colang only when the files changed.
+    Compiled configs are reused in-process and persisted as a JSON snapshot in cache_dir
+    (None disables the snapshot) so new workers can skip parsing too.
+    Each call returns a copy, since LLMRails extends the config it is given.
+    """
+    fingerprint = config_fingerprint(config_path)
+    key = (os.path.abspath(config_path), fingerprint)
+
+    with _lock:
+        if key in _compiled:
+            return _compiled[key].model_copy(deep=True)
+
+        snapshot_path = _snapshot_path(config_path, cache_dir) if cache_dir else None
+        config = _read_snapshot(snapshot_path, fingerprint) if snapshot_path else None
+        if config is None:
+            config = RailsConfig.from_path(config_path)
+            if snapshot_path:
+                _write_snapshot(snapshot_path, fingerprint, config)
+
+        _compiled[key] = config
+        return config.model_copy(deep=True)
+
+
+def load_rag_settings(config_path: str = "config") -> Dict:
+    """The app-specific `rag:` section of config.yml, which RailsConfig does not interpret"""
+    with open(os.path.join(config_path, "config.yml"), "r", encoding="utf-8") as f:
+        return (yaml.safe_load(f) or {}).get("rag", {})
@@ -0,0 +1,44 @@
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+@dataclass
+class RetrievedChunk:
+    text: str
+    metadata: Dict
+    score: float  # cosine similarity, 1 - Chroma cosine distance
+
+
+@dataclass
+class RetrievalResult:
+    """Scored retrieval hits plus the verdict on whether any of them is relevant enough to answer from"""
+
+    query: str
+    threshold: float
+    chunks: List[RetrievedChunk] = field(default_factory=list)
+
+    @property
+    def relevant_chunks(self) -> List[RetrievedChunk]:
+        return [chunk for chunk in self.chunks if chunk.score >= self.threshold]
+
+    @property
+    def relevant(self) -> bool:
+        return bool(self.relevant_chunks)
+
+    @property
+    def context(self) -> str:
+        """Prompt context built only from chunks that clear the threshold"""
+        return "\n\n---\n\n".join(
+            f"From {chunk.metadata.get('source', 'Unknown source')}:\n{chunk.text}"
+            for chunk in self.relevant_chunks
+        )
+
+    def to_dict(self) -> Dict:
+        """Plain dict for Colang flows, e.g. `$retrieval.relevant` and `$retrieval.context`"""
+        return {
+            "relevant": self.relevant,
+            "context": self.context,
+            "top_score": max((chunk.score for chunk in self.chunks), default=0.0),
+            "scores": [chunk.score for chunk in self.chunks],
+            "sources": [chunk.metadata.get("source") for chunk in self.relevant_chunks],
+        }
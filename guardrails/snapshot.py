@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pyarrow as pa
+from retrieval import RetrievedChunk
+
+SNAPSHOT_FORMAT = "1"
+LATEST_FILE = "LATEST"
+EXPORT_PAGE_SIZE = 5000
+
+COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def export_snapshot(collection, directory: str, embedding_model: str) -> str:
+    """
+    Write a collection's chunks, metadata and embeddings to a new versioned Arrow IPC
+    file under directory and point LATEST at it. Returns the snapshot path.
+    """
+    ids, texts, metadatas, embeddings = [], [], [], []
+    total = collection.count()
+    for offset in range(0, total, EXPORT_PAGE_SIZE):
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=offset
+        )
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(json.dumps(m or {}) for m in page["metadatas"])
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+
+    if not ids:
+        raise ValueError(f"Collection '{collection.name}' is empty, nothing to export")
+
+    matrix = np.concatenate(embeddings)
+    dim = matrix.shape[1]
+    now = time.time()
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}"
+
+    table = pa.table(
+        {
+            "id": pa.array(ids, pa.string()),
+            "text": pa.array(texts, pa.string()),
+            "metadata": pa.array(metadatas, pa.string()),
+            "embedding": pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), dim),
+        },
+        metadata={
+            "snapshot_format": SNAPSHOT_FORMAT,
+            "version": version,
+            "collection": collection.name,
+            "embedding_model": embedding_model,
+            "dim": str(dim),
+        }
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{version}.arrow")
+    # Uncompressed IPC file so replicas can memory-map it without copying
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    tmp_latest = os.path.join(directory, f"{LATEST_FILE}.tmp")
+    with open(tmp_latest, "w") as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp_latest, os.path.join(directory, LATEST_FILE))
+    return path
+
+
+def _matches_field(metadata: Dict, key: str, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    for operator in condition:
+        if operator not in COMPARISONS:
+            raise ValueError(f"Unsupported where operator '{operator}' for '{key}'")
+    if key not in metadata:
+        return False
+    for operator, operand in condition.items():
+        try:
+            if not COMPARISONS[operator](metadata[key], operand):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    """Evaluate a Chroma-style metadata filter ($and/$or plus $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin)"""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported where operator '{key}'")
+        elif not _matches_field(metadata, key, condition):
+            return False
+    return True
+
+
+class SnapshotIndex:
+    """Read-only, memory-mapped snapshot searched by exact cosine similarity"""
+
+    def __init__(self, path: str, embedding_model: Optional[str] = None):
+        self.path = path
+        self.table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+        schema_metadata = {k.decode(): v.decode() for k, v in (self.table.schema.metadata or {}).items()}
+        if schema_metadata.get("snapshot_format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format in {path}")
+        if embedding_model and schema_metadata.get("embedding_model") != embedding_model:
+            raise ValueError(
+                f"Snapshot {path} was built with '{schema_metadata.get('embedding_model')}', "
+                f"not '{embedding_model}'"
+            )
+        self.version = schema_metadata["version"]
+        self.dim = int(schema_metadata["dim"])
+
+        embedding_column = self.table.column("embedding").combine_chunks()
+        self.embeddings = embedding_column.flatten().to_numpy(zero_copy_only=True).reshape(-1, self.dim)
+        self._texts = self.table.column("text")
+        self._metadatas = None
+
+    def text(self, i: int) -> str:
+        """Chunk text for one row, decoded from the mapped file on demand"""
+        return self._texts[int(i)].as_py()
+
+    @property
+    def metadatas(self) -> List[Dict]:
+        if self._metadatas is None:
+            self._metadatas = [json.loads(m) for m in self.table.column("metadata").to_pylist()]
+        return self._metadatas
+
+    def count(self) -> int:
+        return self.table.num_rows
+
+    def query(self, query_embedding: np.ndarray, k: int, where: Optional[Dict] = None) -> List[RetrievedChunk]:
+        """Top-k chunks by cosine similarity; where is a Chroma-style metadata filter"""
+        scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        if where:
+            mask = np.array([
+                matches_where(metadata, where) for metadata in self.metadatas
+            ], dtype=bool)
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            RetrievedChunk(text=self.text(i), metadata=self.metadatas[i], score=float(scores[i]))
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+
+class SnapshotStore:
+    """
+    Snapshots for a set of collections, one sub-directory each. reload() switches any
+    collection whose LATEST pointer moved to the new version without a restart.
+    """
+
+    def __init__(self, directory: str, embedding_model: Optional[str] = None):
+        self.directory = directory
+        self.embedding_model = embedding_model
+        self._indexes: Dict[str, SnapshotIndex] = {}
+        self._lock = threading.Lock()
+
+    def _latest_path(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, name, LATEST_FILE)) as f:
+                return os.path.join(self.directory, name, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def get(self, name: str) -> Optional[SnapshotIndex]:
+        """Index for a collection name, loading its latest snapshot on first use"""
+        with self._lock:
+            if name not in self._indexes:
+                path = self._latest_path(name)
+                if path is None:
+                    return None
+                self._indexes[name] = SnapshotIndex(path, self.embedding_model)
+            return self._indexes[name]
+
+    def reload(self) -> List[str]:
+        """Load newer snapshots for already-open collections; returns the names that changed"""
+        changed = []
+        with self._lock:
+            for name, index in list(self._indexes.items()):
+                path = self._latest_path(name)
+                if path and path != index.path:
+                    self._indexes[name] = SnapshotIndex(path, self.embedding_model)
+                    changed.append(name)
+        return changed
+
+
+_stores: Dict[tuple, SnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(directory: str, embedding_model: Optional[str] = None) -> SnapshotStore:
+    """Process-wide store per directory, so sessions share one mapping of each snapshot"""
+    key = (os.path.abspath(directory), embedding_model)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SnapshotStore(directory, embedding_model)
+        return _stores[key]
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from nemoguardrails.actions.actions import ActionResult
+
+PRUNE_EVERY = 100
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip()).casefold()
+
+
+def prompt_hash(config, task: str) -> str:
+    """Hash of the prompt template a rail renders, so editing prompts.yml invalidates its verdicts"""
+    prompts = [p.model_dump(mode="json") for p in (config.prompts or []) if p.task == task]
+    return hashlib.sha256(json.dumps(prompts, sort_keys=True).encode()).hexdigest()
+
+
+class VerdictCache:
+    """
+    Bounded, TTL-limited cache of rail verdicts: an in-memory LRU in front of an
+    optional SQLite file shared by every worker on the node
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 10_000, ttl_seconds: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict INTEGER, created REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_created ON verdicts (created)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(rail: str, template_hash: str, model: str, texts: List[str]) -> str:
+        digest = hashlib.sha256()
+        for part in (rail, template_hash, model, *map(normalize_text, texts)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bool]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT verdict, created FROM verdicts WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    entry = (bool(row[0]), row[1])
+            if entry is None or now - entry[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            self._evict_memory()
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, verdict: bool):
+        now = time.time()
+        with self._lock:
+            self._memory[key] = (verdict, now)
+            self._memory.move_to_end(key)
+            self._evict_memory()
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, verdict, created) VALUES (?, ?, ?)",
+                    (key, int(verdict), now)
+                )
+                self._writes += 1
+                # Pruning scans the table, so only do it every PRUNE_EVERY writes
+                if self._writes % PRUNE_EVERY == 0:
+                    self._db.execute("DELETE FROM verdicts WHERE created < ?", (now - self.ttl_seconds,))
+                    self._db.execute(
+                        "DELETE FROM verdicts WHERE key NOT IN "
+                        "(SELECT key FROM verdicts ORDER BY created DESC LIMIT ?)",
+                        (self.max_entries,)
+                    )
+                self._db.commit()
+
+    def _evict_memory(self):
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+def cached_self_check(cache: VerdictCache, rail: str, check: Callable, text_keys: List[str]) -> Callable:
+    """
+    Wrap a self-check rail action so identical texts reuse an earlier verdict.
+    text_keys are the context variables the rail's prompt is rendered from.
+    Cache reads and writes may hit SQLite, so they run in a worker thread.
+    """
+
+    async def action(llm_task_manager, context: Optional[dict] = None, llm=None, config=None):
+        context = context or {}
+        key = cache.make_key(
+            rail,
+            prompt_hash(config, rail),
+            config.models[0].model if config.models else "",
+            [context.get(name) or "" for name in text_keys]
+        )
+        verdict = await asyncio.to_thread(cache.get, key)
+        if verdict is not None:
+            return verdict
+
+        result = await check(llm_task_manager=llm_task_manager, context=context, llm=llm, config=config)
+
+        # Only plain verdicts are cached; results that also emit events are passed through
+        if isinstance(result, ActionResult):
+            if not result.events:
+                await asyncio.to_thread(cache.set, key, bool(result.return_value))
+        elif isinstance(result, bool):
+            await asyncio.to_thread(cache.set, key, result)
+        return result
+
+    return action
+
+
+_verdict_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> VerdictCache:
+    """Return the process-wide verdict cache, persisted under .rails_cache/ by default"""
+    global _verdict_cache
+    with _cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache(
+                path=os.getenv("VERDICT_CACHE_PATH", ".rails_cache/verdicts.sqlite3") or None,
+                max_entries=int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "10000")),
+                ttl_seconds=float(os.getenv("VERDICT_CACHE_TTL_SECONDS", "86400"))
+            )
+        return _verdict_cache